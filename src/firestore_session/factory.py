@@ -1,4 +1,3 @@
-from urllib.parse import urlparse
 from .firestore_session_service import FirestoreSessionService
 
 def firestore_session_service_factory(uri: str, **kwargs):
@@ -11,12 +10,16 @@ def firestore_session_service_factory(uri: str, **kwargs):
     - firestore://my-project/my-database
     - firestore://default  (uses default project/database from env)
     """
-    parsed = urlparse(uri)
+    # Drop the scheme, then split "[project]/[database]" in a single pass
+    _, _, rest = uri.partition("://")
+    netloc, _, path = rest.partition("/")
     
     # Netloc handles the project ID
-    project = parsed.netloc if parsed.netloc and parsed.netloc != "default" else None
+    project = netloc if netloc and netloc != "default" else None
     
-    # Path handles the database ID (lstrip removes the leading /)
-    database = parsed.path.lstrip('/') if parsed.path.lstrip('/') else None
+    # Path handles the database ID (lstrip removes any extra leading /)
+    database = path.lstrip('/') or None
     
+    # Each service gets its own client: the factory runs synchronously and
+    # can't know which event loop the client's gRPC channel will bind to.
     return FirestoreSessionService(project=project, database=database)
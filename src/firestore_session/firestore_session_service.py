@@ -13,9 +13,11 @@
 # limitations under the License.
 
 from typing import Any, Optional, AsyncGenerator
+import asyncio
 import uuid
 import time
 import copy
+import itertools
 from google.cloud import firestore
 from google.adk.sessions.base_session_service import BaseSessionService
 from google.adk.sessions.base_session_service import GetSessionConfig
@@ -24,6 +26,67 @@ from google.adk.sessions.session import Session
 from google.adk.events.event import Event
 from google.adk.sessions.state import State
 
+# State prefixes and their lengths, resolved once instead of per key
+_APP_PREFIX = State.APP_PREFIX
+_USER_PREFIX = State.USER_PREFIX
+_TEMP_PREFIX = State.TEMP_PREFIX
+_APP_PREFIX_LEN = len(_APP_PREFIX)
+_USER_PREFIX_LEN = len(_USER_PREFIX)
+
+# Field names accepted by Session, used to vet documents before trusting them
+_SESSION_MODEL_FIELDS = frozenset(Session.model_fields)
+
+# Upper bound on cached (app, user) reference pairs per service instance
+_REF_CACHE_SIZE = 1024
+
+# Upper bound on cached app/user state documents per service instance
+_STATE_CACHE_SIZE = 1024
+
+# Sentinel for a state cache miss (a cached document may itself be None)
+_MISS = object()
+
+# Events past this many are validated in a worker thread instead of inline
+_THREADED_VALIDATION_THRESHOLD = 100
+
+
+def _bounded_put(cache: dict, key: Any, value: Any, max_size: int) -> None:
+    if key not in cache and len(cache) >= max_size:
+        # Evict the oldest entry (dicts preserve insertion order)
+        del cache[next(iter(cache))]
+    cache[key] = value
+
+
+def _is_plain_value(value: Any) -> bool:
+    return value is None or isinstance(value, (str, int, float, bool, list))
+
+
+def _has_session_shape(data: dict[str, Any]) -> bool:
+    last_update_time = data.get("last_update_time", 0.0)
+    return (
+        data.keys() <= _SESSION_MODEL_FIELDS
+        and all(isinstance(data.get(k), str) for k in ("id", "app_name", "user_id"))
+        and isinstance(data.get("state", {}), dict)
+        and isinstance(last_update_time, (int, float))
+        and not isinstance(last_update_time, bool)
+    )
+
+
+def _validate_event(event_data: dict[str, Any]) -> Optional[Event]:
+    try:
+        return Event.model_validate(event_data)
+    except Exception:
+        return None
+
+
+def _validate_events(event_dicts: list[dict[str, Any]]) -> list[Event]:
+    loaded_events = []
+    for event_data in event_dicts:
+        event = _validate_event(event_data)
+        if event is not None:
+            loaded_events.append(event)
+    return loaded_events
+
+
 class FirestoreSessionService(BaseSessionService):
     """
     A Firestore-based implementation of the SessionService.
@@ -39,17 +102,43 @@ class FirestoreSessionService(BaseSessionService):
     def __init__(
         self, 
         project: Optional[str] = None,
-        database: Optional[str] = None
+        database: Optional[str] = None,
+        client: Optional[firestore.AsyncClient] = None,
+        trust_stored_schema: bool = True,
+        state_cache_ttl: float = 30.0,
     ):
         """
         Args:
             project: Optional Google Cloud Project ID.
             database: Optional Firestore database instance name.
+            client: Optional existing AsyncClient to share between services.
+                When given, project and database are ignored.
+            trust_stored_schema: If True, session documents read back from
+                Firestore are constructed without re-running validation,
+                after only a cheap check of their field names and types.
+                Documents that fail the check are fully validated.
+            state_cache_ttl: Seconds to cache app and user state documents
+                between reads. Writes made through append_event update the
+                cache immediately. Set to 0 to disable caching.
         """
         # Initialize the client with provided project/database identifiers
         # If identifiers are None, AsyncClient uses GOOGLE_CLOUD_PROJECT
         # and GOOGLE_DATABASE env vars or default credentials.
-        self._client = firestore.AsyncClient(project=project, database=database)
+        if client is None:
+            client = firestore.AsyncClient(project=project, database=database)
+        self._client = client
+        self._ref_cache: dict[tuple[str, str], tuple[Any, Any]] = {}
+        self._trust_stored_schema = trust_stored_schema
+        self._state_cache_ttl = state_cache_ttl
+        # Cached entries are (expires_at, data) keyed on app_name and
+        # (app_name, user_id) respectively.
+        self._app_state_cache: dict[str, tuple[float, Optional[dict]]] = {}
+        self._user_state_cache: dict[tuple[str, str], tuple[float, Optional[dict]]] = {}
+        # Bumped whenever append_event writes a state document, so a read
+        # that raced with the write doesn't cache what it saw.
+        self._state_generations = itertools.count()
+        self._app_state_generation: dict[str, int] = {}
+        self._user_state_generation: dict[tuple[str, str], int] = {}
 
     async def create_session(
         self,
@@ -63,9 +152,8 @@ class FirestoreSessionService(BaseSessionService):
             session_id.strip() if session_id and session_id.strip() else str(uuid.uuid4())
         )
         
-        session_ref = self._client.collection("apps").document(app_name)\
-            .collection("users").document(user_id)\
-            .collection("sessions").document(session_id)
+        _, user_ref = self._app_user_refs(app_name, user_id)
+        session_ref = user_ref.collection("sessions").document(session_id)
 
         current_time = time.time()
         initial_session_state = state or {}
@@ -80,8 +168,10 @@ class FirestoreSessionService(BaseSessionService):
             # We don't persist 'events' list in the document, it's reconstructed
         }
 
-        # Create the session document
-        await session_ref.set(session_data)
+        # Create the session document while fetching app/user state
+        _, (app_data, user_data) = await asyncio.gather(
+            session_ref.set(session_data), self._fetch_state(app_name, user_id)
+        )
 
         # Create the local Session object to return
         session = Session(
@@ -93,7 +183,7 @@ class FirestoreSessionService(BaseSessionService):
             events=[]
         )
 
-        return await self._merge_state(app_name, user_id, session)
+        return self._apply_state(session, app_data, user_data)
 
     async def get_session(
         self,
@@ -103,11 +193,28 @@ class FirestoreSessionService(BaseSessionService):
         session_id: str,
         config: Optional[GetSessionConfig] = None,
     ) -> Optional[Session]:
-        session_ref = self._client.collection("apps").document(app_name)\
-            .collection("users").document(user_id)\
-            .collection("sessions").document(session_id)
+        _, user_ref = self._app_user_refs(app_name, user_id)
+        session_ref = user_ref.collection("sessions").document(session_id)
 
-        doc_snapshot = await session_ref.get()
+        # Build the events query up front so it can run alongside the other reads
+        events_ref = session_ref.collection("events")
+        num_recent_events = config.num_recent_events if config else None
+        after_timestamp = config.after_timestamp if config else None
+
+        # Compose filters so after_timestamp and num_recent_events both apply
+        if num_recent_events:
+            query = events_ref.order_by("timestamp", direction=firestore.Query.DESCENDING)
+        else:
+            query = events_ref.order_by("timestamp")
+        if after_timestamp:
+            query = query.where(filter=firestore.FieldFilter("timestamp", ">", after_timestamp))
+        if num_recent_events:
+            query = query.limit(num_recent_events)
+
+        # None of these reads depend on each other, so issue them concurrently
+        doc_snapshot, loaded_events, (app_data, user_data) = await asyncio.gather(
+            session_ref.get(), self._load_events(query), self._fetch_state(app_name, user_id)
+        )
         if not doc_snapshot.exists:
             return None
 
@@ -118,7 +225,7 @@ class FirestoreSessionService(BaseSessionService):
         # Reconstruct base Session object
         try:
             # We explicitly handle 'events' being empty list here
-            session = Session.model_validate(session_data)
+            session = self._build_session(session_data)
         except Exception as e:
             # Fallback if validation fails (e.g. data structure evolution)
             session = Session(
@@ -130,54 +237,35 @@ class FirestoreSessionService(BaseSessionService):
                 events=[]
             )
 
-        # Fetch events
-        events_ref = session_ref.collection("events")
-        query = events_ref.order_by("timestamp")
-
-        if config:
-            if config.after_timestamp:
-                query = query.where(filter=firestore.FieldFilter("timestamp", ">", config.after_timestamp))
-            if config.num_recent_events:
-                 query = events_ref.order_by("timestamp", direction=firestore.Query.DESCENDING).limit(config.num_recent_events)
-        
-        # Execute query
-        events_snapshots = await query.get()
-        
-        loaded_events = []
-        for snap in events_snapshots:
-            event_data = snap.to_dict()
-            try:
-                event = Event.model_validate(event_data)
-                loaded_events.append(event)
-            except Exception:
-                continue
-
-        if config and config.num_recent_events:
-            loaded_events.sort(key=lambda e: e.timestamp)
+        if num_recent_events:
+            # The query returned newest first; restore chronological order
+            loaded_events.reverse()
 
         session.events = loaded_events
         
-        return await self._merge_state(app_name, user_id, session)
+        return self._apply_state(session, app_data, user_data)
 
     async def list_sessions(
         self, *, app_name: str, user_id: str
     ) -> ListSessionsResponse:
-        sessions_ref = self._client.collection("apps").document(app_name)\
-            .collection("users").document(user_id)\
-            .collection("sessions")
+        _, user_ref = self._app_user_refs(app_name, user_id)
+        sessions_ref = user_ref.collection("sessions")
         
         query = sessions_ref.order_by("last_update_time", direction=firestore.Query.DESCENDING)
         
-        snapshots = await query.get()
+        # App and user state are the same for every session in the listing,
+        # so fetch them once alongside the query.
+        snapshots, (app_data, user_data) = await asyncio.gather(
+            query.get(), self._fetch_state(app_name, user_id)
+        )
         sessions_list = []
         
         for snap in snapshots:
             data = snap.to_dict()
             data["events"] = [] # Don't load events for listing
             try:
-                session = Session.model_validate(data)
-                merged_session = await self._merge_state(app_name, user_id, session)
-                sessions_list.append(merged_session)
+                session = self._build_session(data)
+                sessions_list.append(self._apply_state(session, app_data, user_data))
             except Exception:
                 continue
                 
@@ -186,13 +274,15 @@ class FirestoreSessionService(BaseSessionService):
     async def delete_session(
         self, *, app_name: str, user_id: str, session_id: str
     ) -> None:
-        session_ref = self._client.collection("apps").document(app_name)\
-            .collection("users").document(user_id)\
-            .collection("sessions").document(session_id)
-            
+        _, user_ref = self._app_user_refs(app_name, user_id)
+        session_ref = user_ref.collection("sessions").document(session_id)
+
         events_ref = session_ref.collection("events")
-        await self._delete_collection(events_ref, batch_size=50)
-        await session_ref.delete()
+        batches = await self._delete_batches(events_ref, batch_size=400)
+        # Commit all event deletions in parallel with the session delete
+        await asyncio.gather(
+            *(batch.commit() for batch in batches), session_ref.delete()
+        )
 
     async def append_event(self, session: Session, event: Event) -> Event:
         if event.partial:
@@ -202,40 +292,46 @@ class FirestoreSessionService(BaseSessionService):
         session.events.append(event)
         session.last_update_time = event.timestamp
 
-        batch = self._client.batch()
-        
         app_name = session.app_name
         user_id = session.user_id
         session_id = session.id
         
-        app_ref = self._client.collection("apps").document(app_name)
-        user_ref = app_ref.collection("users").document(user_id)
+        app_ref, user_ref = self._app_user_refs(app_name, user_id)
         session_ref = user_ref.collection("sessions").document(session_id)
         event_ref = session_ref.collection("events").document(event.id)
 
-        event_dict = event.model_dump(mode='json', exclude_none=True)
-        batch.set(event_ref, event_dict)
-
         app_updates = {}
         user_updates = {}
         session_updates = {}
 
         if event.actions and event.actions.state_delta:
             for key, value in event.actions.state_delta.items():
-                if not key or key.startswith(State.TEMP_PREFIX):
+                if not key or key.startswith(_TEMP_PREFIX):
                     continue
                 
-                if key.startswith(State.APP_PREFIX):
-                    clean_key = key.removeprefix(State.APP_PREFIX)
+                if key.startswith(_APP_PREFIX):
+                    clean_key = key[_APP_PREFIX_LEN:]
                     if clean_key:
                         app_updates[clean_key] = value
-                elif key.startswith(State.USER_PREFIX):
-                    clean_key = key.removeprefix(State.USER_PREFIX)
+                elif key.startswith(_USER_PREFIX):
+                    clean_key = key[_USER_PREFIX_LEN:]
                     if clean_key:
                         user_updates[clean_key] = value
                 else:
                     session_updates[f"state.{key}"] = value
 
+        if not app_updates and not user_updates and not session_updates:
+            # Nothing needs to change atomically with the event, so issue
+            # the two writes in parallel instead of building a batch.
+            await asyncio.gather(
+                self._set_event(event_ref, event),
+                session_ref.update({"last_update_time": session.last_update_time}),
+            )
+            return event
+
+        batch = self._client.batch()
+        await self._set_event(event_ref, event, batch=batch)
+
         if app_updates:
             batch.set(app_ref, app_updates, merge=True)
         
@@ -246,40 +342,174 @@ class FirestoreSessionService(BaseSessionService):
         batch.update(session_ref, session_updates)
 
         await batch.commit()
+
+        # Writes from this service keep the state cache authoritative
+        if app_updates:
+            self._bump_generation(self._app_state_generation, app_name)
+            self._write_through(self._app_state_cache, app_name, app_updates)
+        if user_updates:
+            self._bump_generation(self._user_state_generation, (app_name, user_id))
+            self._write_through(self._user_state_cache, (app_name, user_id), user_updates)
+
         return event
 
-    async def _merge_state(self, app_name: str, user_id: str, session: Session) -> Session:
-        app_ref = self._client.collection("apps").document(app_name)
-        app_snap = await app_ref.get()
-        if app_snap.exists:
-            app_data = app_snap.to_dict()
+    async def _set_event(
+        self,
+        event_ref,
+        event: Event,
+        batch: Optional[firestore.AsyncWriteBatch] = None,
+    ) -> None:
+        # Firestore encodes Python values natively, so skip the JSON coercion
+        # pass unless the event holds a type the client can't encode.
+        # Encoding happens before anything is queued or sent.
+        if batch is not None:
+            try:
+                batch.set(event_ref, event.model_dump(exclude_none=True))
+            except TypeError:
+                batch.set(event_ref, event.model_dump(mode='json', exclude_none=True))
+        else:
+            try:
+                await event_ref.set(event.model_dump(exclude_none=True))
+            except TypeError:
+                await event_ref.set(event.model_dump(mode='json', exclude_none=True))
+
+    def _app_user_refs(self, app_name: str, user_id: str) -> tuple[Any, Any]:
+        key = (app_name, user_id)
+        refs = self._ref_cache.get(key)
+        if refs is None:
+            app_ref = self._client.collection("apps").document(app_name)
+            refs = (app_ref, app_ref.collection("users").document(user_id))
+            _bounded_put(self._ref_cache, key, refs, _REF_CACHE_SIZE)
+        return refs
+
+    def _build_session(self, data: dict[str, Any]) -> Session:
+        # Session documents are written by this service from validated
+        # models, so re-validating them on every read is redundant.
+        # model_construct checks nothing itself, so only use it when the
+        # document has the shape this service writes.
+        if self._trust_stored_schema and _has_session_shape(data):
+            return Session.model_construct(**data)
+        return Session.model_validate(data)
+
+    async def _load_events(self, query) -> list[Event]:
+        # Validate events as they arrive. Past the threshold, collect the
+        # rest and validate them in a worker thread so a large session
+        # doesn't block the event loop.
+        loaded_events = []
+        tail = []
+        streamed = 0
+        async for snap in query.stream():
+            if streamed < _THREADED_VALIDATION_THRESHOLD:
+                event = _validate_event(snap.to_dict())
+                if event is not None:
+                    loaded_events.append(event)
+            else:
+                tail.append(snap.to_dict())
+            streamed += 1
+
+        if tail:
+            loaded_events.extend(await asyncio.to_thread(_validate_events, tail))
+        return loaded_events
+
+    async def _fetch_state(
+        self, app_name: str, user_id: str
+    ) -> tuple[Optional[dict[str, Any]], Optional[dict[str, Any]]]:
+        app_key = app_name
+        user_key = (app_name, user_id)
+        app_data = self._cached_state(self._app_state_cache, app_key)
+        user_data = self._cached_state(self._user_state_cache, user_key)
+
+        app_generation = self._app_state_generation.get(app_key)
+        user_generation = self._user_state_generation.get(user_key)
+
+        # Only read the documents that are not cached, concurrently
+        app_ref, user_ref = self._app_user_refs(app_name, user_id)
+        reads = []
+        if app_data is _MISS:
+            reads.append(app_ref.get())
+        if user_data is _MISS:
+            reads.append(user_ref.get())
+        snaps = iter(await asyncio.gather(*reads))
+
+        # A snapshot read while append_event was writing may predate the
+        # write, so only cache it if no write landed since the read began.
+        if app_data is _MISS:
+            app_data = next(snaps).to_dict()
+            if self._app_state_generation.get(app_key) == app_generation:
+                app_data = self._store_state(self._app_state_cache, app_key, app_data)
+        if user_data is _MISS:
+            user_data = next(snaps).to_dict()
+            if self._user_state_generation.get(user_key) == user_generation:
+                user_data = self._store_state(self._user_state_cache, user_key, user_data)
+
+        return app_data, user_data
+
+    def _cached_state(self, cache: dict, key: Any) -> Any:
+        entry = cache.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return _MISS
+        # Hand out copies so callers can't mutate the cached document
+        return copy.deepcopy(entry[1])
+
+    def _write_through(self, cache: dict, key: Any, updates: dict[str, Any]) -> None:
+        entry = cache.get(key)
+        if entry is None:
+            return
+        # set(merge=True) deep-merges maps and applies transforms server
+        # side, so only mirror plain values locally and otherwise drop the
+        # entry to force a fresh read.
+        if not all(_is_plain_value(v) for v in updates.values()):
+            del cache[key]
+            return
+        data = dict(entry[1] or {})
+        data.update(copy.deepcopy(updates))
+        cache[key] = (entry[0], data)
+
+    def _bump_generation(self, generations: dict, key: Any) -> None:
+        _bounded_put(generations, key, next(self._state_generations), _STATE_CACHE_SIZE)
+
+    def _store_state(
+        self, cache: dict, key: Any, data: Optional[dict[str, Any]]
+    ) -> Optional[dict[str, Any]]:
+        if self._state_cache_ttl <= 0:
+            return data
+        expires_at = time.monotonic() + self._state_cache_ttl
+        _bounded_put(cache, key, (expires_at, data), _STATE_CACHE_SIZE)
+        return copy.deepcopy(data)
+
+    @staticmethod
+    def _apply_state(
+        session: Session,
+        app_data: Optional[dict[str, Any]],
+        user_data: Optional[dict[str, Any]],
+    ) -> Session:
+        if app_data:
             for k, v in app_data.items():
-                session.state[State.APP_PREFIX + k] = v
+                session.state[_APP_PREFIX + k] = v
 
-        user_ref = app_ref.collection("users").document(user_id)
-        user_snap = await user_ref.get()
-        if user_snap.exists:
-            user_data = user_snap.to_dict()
+        if user_data:
             for k, v in user_data.items():
-                session.state[State.USER_PREFIX + k] = v
-                
+                session.state[_USER_PREFIX + k] = v
+
         return session
 
-    async def _delete_collection(self, coll_ref, batch_size):
-        docs = await coll_ref.limit(batch_size).get()
-        deleted = 0
+    async def _delete_batches(self, coll_ref, batch_size):
+        # list_documents only returns references, no document payloads
+        doc_refs = [doc_ref async for doc_ref in coll_ref.list_documents()]
 
-        for doc in docs:
-            await doc.reference.delete()
-            deleted += 1
+        batches = []
+        for i in range(0, len(doc_refs), batch_size):
+            batch = self._client.batch()
+            for doc_ref in doc_refs[i:i + batch_size]:
+                batch.delete(doc_ref)
+            batches.append(batch)
 
-        if deleted >= batch_size:
-            return await self._delete_collection(coll_ref, batch_size)
+        return batches
 
     def _update_session_state_local(self, session: Session, event: Event) -> None:
         if not event.actions or not event.actions.state_delta:
             return
         for key, value in event.actions.state_delta.items():
-            if key.startswith(State.TEMP_PREFIX):
+            if key.startswith(_TEMP_PREFIX):
                 continue
             session.state.update({key: value})
\ No newline at end of file
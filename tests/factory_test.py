@@ -1,5 +1,7 @@
+import asyncio
 from unittest.mock import patch
 import pytest
+from google.api_core import exceptions
 from firestore_session import firestore_session_service_factory
 
 @pytest.mark.parametrize("uri, expected_project, expected_database", [
@@ -28,3 +30,18 @@ def test_factory_uri_parsing(uri, expected_project, expected_database):
             project=expected_project,
             database=expected_database
         )
+
+def test_factory_services_work_across_event_loops(monkeypatch):
+    """Verifies that a service from one event loop doesn't break the next loop."""
+    # Point at a closed port so reads fail fast instead of needing a server
+    monkeypatch.setenv("FIRESTORE_EMULATOR_HOST", "localhost:1")
+    
+    async def read_document():
+        service = firestore_session_service_factory("firestore://p/d")
+        doc_ref = service._client.collection("apps").document("app")
+        with pytest.raises(exceptions.ServiceUnavailable):
+            await doc_ref.get(retry=None, timeout=5)
+    
+    # A client bound to the first loop would fail with "Event loop is closed"
+    asyncio.run(read_document())
+    asyncio.run(read_document())